@@ -1,19 +1,31 @@
 import os
-import io
+import re
+import tempfile
+import time
+import threading
+import asyncio
+import hashlib
 import json
-import math
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 import google.generativeai as genai
 import faiss
 import numpy as np
-from pypdf import PdfReader
+import orjson
+
+from pdf_text import count_pages, extract_page_range
 
 
 # ---------------------------
@@ -28,70 +40,315 @@ genai.configure(api_key=api_key)
 
 GEN_MODEL = "models/gemini-2.5-flash"
 EMBED_MODEL = "models/text-embedding-004"
+EMBED_BATCH_SIZE = 100  # max texts per batchEmbedContents request
+EMBED_WORKERS = 16
+# Below this many chunks a single NumPy matmul beats FAISS's flat search.
+FAISS_MIN_CHUNKS = 200_000
+INITIAL_CAPACITY = 4096
+# Rows upcast from float16 to float32 at a time during search; 512 x 768
+# float32 is 1.5 MiB, small enough to stay in cache between copy and matmul.
+SEARCH_BLOCK_ROWS = 512
+QUERY_BATCH_WINDOW = 0.02  # seconds to wait for concurrent queries to batch
+QUERY_CACHE_SIZE = 256  # most recent /api/query answers kept
+# Set FAISS_USE_GPU=1 to put the large-corpus FAISS index on GPU 0
+# (requires a faiss-gpu build and a visible GPU).
+FAISS_USE_GPU = (
+    os.getenv("FAISS_USE_GPU", "").lower() in ("1", "true", "yes")
+    and hasattr(faiss, "StandardGpuResources")
+    and faiss.get_num_gpus() > 0
+)
 
 gen_model = genai.GenerativeModel(GEN_MODEL)
 
 
 # ---------------------------
-# Utility: robust JSON parsing
+# Prompt templates (static parts built once at import)
 # ---------------------------
-def parse_strict_json(raw: str) -> Any:
-    """
-    Try to robustly parse JSON that may be wrapped in ```json ... ``` fences
-    or have extra explanation around it.
-    """
-    s = raw.strip()
+QUERY_PROMPT_PREFIX = (
+    "You are an ESG and sustainability analysis assistant. "
+    "You must answer ONLY using the context below. "
+    "If the answer is not clearly supported by the context, say you cannot find it.\n\n"
+    "Context:\n"
+)
+QUERY_PROMPT_SUFFIX = (
+    "\n\nAnswer clearly and concisely. When relevant, refer to context items like [1], [2]."
+)
 
-    # Strip markdown code fences if present
-    if s.startswith("```"):
-        # Remove leading ``` or ```json
-        if s.lower().startswith("```json"):
-            s = s[7:]  # len("```json") = 7
-        else:
-            s = s[3:]  # len("```") = 3
+SUMMARY_PROMPT_PREFIX = (
+    "You are an ESG analyst. Based only on the context below, write a professional, "
+    "1-page ESG executive summary of this company's sustainability performance.\n\n"
+    "Structure the summary as markdown with the following sections:\n"
+    "1. Overview\n"
+    "2. Key environmental metrics (CO₂, energy, water, waste)\n"
+    "3. Social initiatives\n"
+    "4. Governance & risk management\n"
+    "5. Strengths\n"
+    "6. Gaps and risks\n\n"
+    "Be factual and avoid making up data. If a metric is not disclosed, say so.\n\n"
+    "Context:\n"
+)
 
-        # Remove trailing ```
-        if s.endswith("```"):
-            s = s[:-3]
+METRICS_PROMPT_PREFIX = (
+    "You are an ESG data extraction assistant. Based ONLY on the context below, "
+    "extract key ESG metrics and return them as strict JSON. Do not include commentary.\n\n"
+    "Use this exact JSON structure:\n"
+    "{\n"
+    '  "emissions": {\n'
+    '    "scope1_tco2e": number | null,\n'
+    '    "scope2_tco2e": number | null,\n'
+    '    "scope3_tco2e": number | null\n'
+    "  },\n"
+    '  "energy": {\n'
+    '    "total_mwh": number | null\n'
+    "  },\n"
+    '  "water": {\n'
+    '    "withdrawals_m3": number | null\n'
+    "  },\n"
+    '  "waste": {\n'
+    '    "total_tonnes": number | null\n'
+    "  },\n"
+    '  "social": {\n'
+    '    "employees_total": number | null\n'
+    "  },\n"
+    '  "governance": {\n'
+    '    "board_female_pct": number | null\n'
+    "  }\n"
+    "}\n\n"
+    "If a value is not clearly stated, use null. Do NOT add any extra top-level fields. "
+    "Respond with JSON only, no extra text.\n\n"
+    "Context:\n"
+)
 
-    s = s.strip()
+COMPLIANCE_PROMPT_PREFIX = (
+    "You are an ESG reporting compliance assistant. Based ONLY on the context below, "
+    "assess whether the report discusses or references each of the following:\n"
+    "- SDGs (Sustainable Development Goals)\n"
+    "- GRI\n"
+    "- SASB\n"
+    "- IFRS S1\n"
+    "- IFRS S2\n\n"
+    "Return a strict JSON object with this structure:\n"
+    "{\n"
+    '  "sdgs": {"covered": boolean, "notes": string},\n'
+    '  "gri": {"covered": boolean, "notes": string},\n'
+    '  "sasb": {"covered": boolean, "notes": string},\n'
+    '  "ifrs_s1": {"covered": boolean, "notes": string},\n'
+    '  "ifrs_s2": {"covered": boolean, "notes": string}\n'
+    "}\n\n"
+    "If you are not sure, set covered to false and explain briefly in notes. "
+    "Respond with JSON only, no extra text.\n\n"
+    "Context:\n"
+)
 
-    # As an extra safety net: take content between first { and last }
-    first = s.find("{")
-    last = s.rfind("}")
-    if first != -1 and last != -1 and last > first:
-        s = s[first:last + 1]
+RISK_PROMPT_PREFIX = (
+    "You are an ESG analyst assessing potential greenwashing. Based ONLY on the context below, "
+    "assign a simple greenwashing risk label and explanation.\n\n"
+    "Choose one of these labels: Low, Medium, High.\n\n"
+    "Return a strict JSON object:\n"
+    '{\n  "score": "Low" | "Medium" | "High",\n  "explanation": string\n}\n\n'
+    "Do not add other fields. Respond with JSON only.\n\n"
+    "Context:\n"
+)
 
-    return json.loads(s)
+SUMMARY_PROMPT_SUFFIX = "\n\nNow write the markdown summary."
+JSON_PROMPT_SUFFIX = "\n\nReturn JSON now."
+
+NO_CONTEXT_ANSWER = "I couldn’t find relevant ESG context for that question in the uploaded reports."
 
 
 # ---------------------------
-# Simple in-memory ESG index using FAISS
+# Utility: robust JSON parsing
 # ---------------------------
-def l2_normalize(vec):
-    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
-    return [x / norm for x in vec]
+# First "{" through last "}" (greedy), i.e. the outermost JSON object.
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+# Whole reply wrapped in a ``` / ```json fence (closing fence optional).
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*(?:```)?\s*$", re.DOTALL | re.IGNORECASE)
+
+
+def parse_strict_json(raw: str) -> Any:
+    """
+    Try to robustly parse JSON that may be wrapped in ```json ... ``` fences
+    or have extra explanation around it.
+    """
+    m = _JSON_OBJECT_RE.search(raw)
+    if m:
+        s = m.group(0)
+    else:
+        fenced = _FENCE_RE.match(raw)
+        s = fenced.group(1) if fenced else raw.strip()
 
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers
+    # can keep catching the stdlib exception.
+    return orjson.loads(s)
 
+
+# ---------------------------
+# Simple in-memory ESG index (NumPy, FAISS for large corpora)
+# ---------------------------
 class ESGIndex:
     def __init__(self):
-        self.index: Optional[faiss.IndexFlatIP] = None
+        # Normalized embeddings live as float16 in the first `size` rows of
+        # `matrix` (grown geometrically) until the corpus grows past
+        # FAISS_MIN_CHUNKS, after which they are moved into a FAISS fp16
+        # index (scalar-quantized on CPU, flat on GPU).
+        self.matrix: Optional[np.ndarray] = None
+        self.size = 0
+        self.index: Optional[faiss.Index] = None
+        self._gpu_res = None
+        # Guards all index/column writes and the matrix/size/index snapshot
+        # taken by search threads; add_report may run on several threads.
+        self._lock = threading.Lock()
+        self._batch_embed: Optional[bool] = None  # SDK accepts list content?
         self.emb_dim: Optional[int] = None
-        self.chunks: List[Dict[str, Any]] = []
+        # Queries waiting to be searched together, and the (B, emb_dim)
+        # buffer they are packed into; both are only touched under
+        # _search_lock or from the event loop.
+        self._pending: List[Tuple[List[float], int, asyncio.Future]] = []
+        self._search_lock = asyncio.Lock()
+        self._q_buf: Optional[np.ndarray] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # float32 scratch block for _top_k; flushes are serialized by
+        # _search_lock, so only one search uses it at a time.
+        self._scratch: Optional[np.ndarray] = None
+        # Chunks are stored column-wise; chunk i is (chunk_texts[i],
+        # chunk_pages[i], report_table[chunk_report_idx[i]]). The int32
+        # columns grow geometrically like `matrix`; only [:size] is valid,
+        # and size is published last so readers never see partial chunks.
+        self.chunk_texts: List[str] = []
+        self.chunk_formatted: List[str] = []  # "(Page N) text", built at ingest
+        self.chunk_pages: np.ndarray = np.empty(0, dtype=np.int32)
+        self.chunk_report_idx: np.ndarray = np.empty(0, dtype=np.int32)
+        self.report_table: List[str] = []
+        self.report_idx: Dict[str, int] = {}
+        self.chunks_by_report: Dict[str, List[int]] = {}
         self.reports: Dict[str, Dict[str, Any]] = {}
-
-    def _init_index_if_needed(self, example_embedding: List[float]):
+        self._next_id = 1
+        # Memoized Gemini outputs; chunks are immutable once added, so a
+        # given prompt for a report always maps to the same answer.
+        self.llm_cache: Dict[Tuple, Any] = {}
+        # Free-text questions are unbounded, so query answers live in an LRU.
+        self.query_cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+
+    def get_cached_query(self, key: Tuple) -> Any:
+        value = self.query_cache.get(key)
+        if value is not None:
+            self.query_cache.move_to_end(key)
+        return value
+
+    def cache_query(self, key: Tuple, value: Any):
+        self.query_cache[key] = value
+        self.query_cache.move_to_end(key)
+        while len(self.query_cache) > QUERY_CACHE_SIZE:
+            self.query_cache.popitem(last=False)
+
+    def _init_index_if_needed(self, example_embedding):
         if self.emb_dim is None:
             self.emb_dim = len(example_embedding)
-            self.index = faiss.IndexFlatIP(self.emb_dim)
+            self.matrix = np.empty((INITIAL_CAPACITY, self.emb_dim), dtype=np.float16)
+
+    def _new_faiss_index(self) -> faiss.Index:
+        if FAISS_USE_GPU:
+            if self._gpu_res is None:
+                self._gpu_res = faiss.StandardGpuResources()
+            co = faiss.GpuClonerOptions()
+            co.useFloat16 = True
+            return faiss.index_cpu_to_gpu(self._gpu_res, 0, faiss.IndexFlatIP(self.emb_dim), co)
+        return faiss.IndexScalarQuantizer(
+            self.emb_dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+
+    def _reserve_chunk_columns(self, needed: int):
+        capacity = len(self.chunk_pages)
+        if needed <= capacity:
+            return
+        new_capacity = max(2 * capacity, needed, INITIAL_CAPACITY)
+        for name in ("chunk_pages", "chunk_report_idx"):
+            old = getattr(self, name)
+            grown = np.empty(new_capacity, dtype=np.int32)
+            grown[:self.size] = old[:self.size]
+            setattr(self, name, grown)
+
+    def _add_vectors(self, vecs: np.ndarray):
+        """Append vectors and publish the new size; caller holds self._lock."""
+        if self.index is not None:
+            self.index.add(vecs)
+            self.size += len(vecs)
+            return
+
+        k = len(vecs)
+        capacity = len(self.matrix)
+        if self.size + k > capacity:
+            grown = np.empty((max(2 * capacity, self.size + k), self.emb_dim), dtype=np.float16)
+            np.copyto(grown[:self.size], self.matrix[:self.size])
+            self.matrix = grown
+        self.matrix[self.size:self.size + k] = vecs
+        self.size += k
+
+        if self.size > FAISS_MIN_CHUNKS:
+            self.index = self._new_faiss_index()
+            for start in range(0, self.size, SEARCH_BLOCK_ROWS):
+                block = self.matrix[start:min(start + SEARCH_BLOCK_ROWS, self.size)]
+                self.index.add(block.astype(np.float32))
+            self.matrix = None
+
+    def _top_k(self, q_vecs: np.ndarray, k: int):
+        """Return (scores, indices) of shape (len(q_vecs), k), best first."""
+        with self._lock:
+            index, matrix, size = self.index, self.matrix, self.size
+            k = min(k, size)
+            if index is not None:
+                # FAISS indexes (GPU ones especially) can't add while searching.
+                return index.search(q_vecs, k)
+
+        # Rows [:size] of this matrix are never rewritten (growth copies into
+        # a new array), so the snapshot can be read without the lock.
+        if self._scratch is None:
+            self._scratch = np.empty((SEARCH_BLOCK_ROWS, self.emb_dim), dtype=np.float32)
+        scores = np.empty((len(q_vecs), size), dtype=np.float32)
+        for start in range(0, size, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, size)
+            block = self._scratch[:stop - start]
+            np.copyto(block, matrix[start:stop])
+            np.matmul(q_vecs, block.T, out=scores[:, start:stop])
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+        return (
+            np.take_along_axis(part_scores, order, axis=1),
+            np.take_along_axis(part, order, axis=1),
+        )
 
     def _embed_text(self, text: str) -> List[float]:
         resp = genai.embed_content(model=EMBED_MODEL, content=text)
-        emb = resp["embedding"]
-        return l2_normalize(emb)
+        return resp["embedding"]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        resp = genai.embed_content(model=EMBED_MODEL, content=texts)
+        return resp["embedding"]
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed many texts in batched requests; returns raw (unnormalized) vectors."""
+        raw: List[List[float]] = []
+        start = 0
+        if self._batch_embed is None:
+            # Probe once: older SDKs reject list content with a TypeError.
+            # Any other error (quota, auth, network) propagates as-is.
+            try:
+                raw.extend(self._embed_batch(texts[:EMBED_BATCH_SIZE]))
+                start = EMBED_BATCH_SIZE
+                self._batch_embed = True
+            except TypeError:
+                self._batch_embed = False
+
+        if self._batch_embed:
+            for start in range(start, len(texts), EMBED_BATCH_SIZE):
+                raw.extend(self._embed_batch(texts[start:start + EMBED_BATCH_SIZE]))
+        else:
+            # No batching in this SDK; fall back to concurrent single requests.
+            with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+                raw = list(ex.map(self._embed_text, texts))
 
-    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
-        return [self._embed_text(t) for t in texts]
+        return np.ascontiguousarray(raw, dtype=np.float32)
 
     def _chunk_pages(
         self,
@@ -101,22 +358,22 @@ class ESGIndex:
         max_chunks: int = 800,
     ):
         chunks = []
+        step = max(chunk_chars - overlap, 1)
         for page_idx, page_text in enumerate(pages, start=1):
             text = (page_text or "").strip()
             if not text:
                 continue
-            start = 0
-            n = len(text)
-            while start < n:
-                if len(chunks) >= max_chunks:
-                    return chunks
-                end = min(start + chunk_chars, n)
-                chunk = text[start:end].strip()
-                if len(chunk) > 50:
-                    chunks.append((chunk, page_idx))
-                start = end - overlap
-                if start < 0:
-                    start = 0
+            # Window starts up to and including the first one reaching the end.
+            starts = range(0, max(len(text) - chunk_chars, 0) + step, step)
+            windows = (text[s:s + chunk_chars].strip() for s in starts)
+            chunks.extend(
+                islice(
+                    ((chunk, page_idx) for chunk in windows if len(chunk) > 50),
+                    max_chunks - len(chunks),
+                )
+            )
+            if len(chunks) >= max_chunks:
+                break
         return chunks
 
     def add_report(
@@ -125,7 +382,6 @@ class ESGIndex:
         content: str,
         pages_text: Optional[List[str]] = None
     ) -> Dict[str, Any]:
-        report_id = f"rep_{len(self.reports) + 1}_{int(datetime.utcnow().timestamp())}"
         pages = pages_text if pages_text is not None else [content]
 
         chunks_with_pages = self._chunk_pages(pages)
@@ -134,109 +390,208 @@ class ESGIndex:
 
         texts = [c[0] for c in chunks_with_pages]
         embeddings = self._embed_texts(texts)
-        self._init_index_if_needed(embeddings[0])
-
-        vecs = np.array(embeddings, dtype="float32")
-        self.index.add(vecs)
-
-        for chunk_text, page in chunks_with_pages:
-            self.chunks.append(
-                {
-                    "id": len(self.chunks),
-                    "text": chunk_text,
-                    "report_id": report_id,
-                    "report_name": name,
-                    "page": page,
-                }
-            )
+        vecs = np.ascontiguousarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vecs)
+        formatted = [f"(Page {page}) {chunk_text}" for chunk_text, page in chunks_with_pages]
+
+        with self._lock:
+            now_ns = time.time_ns()
+            report_id = f"rep_{self._next_id}_{now_ns // 1_000_000_000}"
+            self._next_id += 1
+            self._init_index_if_needed(vecs[0])
+
+            rep_idx = len(self.report_table)
+            self.report_table.append(report_id)
+            self.report_idx[report_id] = rep_idx
+
+            first_id, n = self.size, len(texts)
+            self._reserve_chunk_columns(first_id + n)
+            self.chunk_pages[first_id:first_id + n] = [c[1] for c in chunks_with_pages]
+            self.chunk_report_idx[first_id:first_id + n] = rep_idx
+            self.chunk_texts.extend(texts)
+            self.chunk_formatted.extend(formatted)
+            self.chunks_by_report[report_id] = list(range(first_id, first_id + n))
+
+            report_meta = {
+                "id": report_id,
+                "name": name,
+                "pages": len(pages),
+                "uploaded_at": datetime.fromtimestamp(now_ns / 1e9, tz=timezone.utc).isoformat(),
+            }
+            self.reports[report_id] = report_meta
 
-        report_meta = {
-            "id": report_id,
-            "name": name,
-            "pages": len(pages),
-            "uploaded_at": datetime.utcnow().isoformat(),
-        }
-        self.reports[report_id] = report_meta
+            # Publishing the vectors bumps self.size, which bounds every
+            # search, so it must come after all the per-chunk data above.
+            self._add_vectors(vecs)
         return report_meta
 
-    def search(
+    async def _batched_top_k(self, q_emb: List[float], k: int):
+        """Queue one query and wait for the batched search that includes it."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((q_emb, k, fut))
+        if len(self._pending) == 1:
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        return await fut
+
+    async def _flush_pending(self):
+        await asyncio.sleep(QUERY_BATCH_WINDOW)
+        async with self._search_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            try:
+                if self._q_buf is None or len(self._q_buf) < len(batch):
+                    self._q_buf = np.empty((max(len(batch), 16), self.emb_dim), dtype=np.float32)
+                q_vecs = self._q_buf[:len(batch)]
+                for row, (q_emb, _, _) in enumerate(batch):
+                    q_vecs[row] = q_emb
+                faiss.normalize_L2(q_vecs)
+
+                distances, indices = await asyncio.to_thread(
+                    self._top_k, q_vecs, max(k for _, k, _ in batch)
+                )
+            except Exception as e:
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+
+        for row, (_, k, fut) in enumerate(batch):
+            if not fut.done():
+                fut.set_result((distances[row, :k], indices[row, :k]))
+
+    async def search(
         self,
         query: str,
         top_k: int = 8,
         report_ids: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        if self.index is None or not self.chunks:
+        if not self.size:
             return []
 
-        q_emb = self._embed_text(query)
+        q_emb = await asyncio.to_thread(self._embed_text, query)
 
-        q_vec = np.array([q_emb], dtype="float32")
-        search_k = max(top_k * 3, top_k)
-        distances, indices = self.index.search(q_vec, search_k)
+        # Over-fetch only when results will be filtered by report. Both search
+        # backends return distinct ids, so no de-duplication is needed.
+        search_k = top_k * 3 if report_ids else top_k
+        distances, indices = await self._batched_top_k(q_emb, search_k)
 
         results = []
-        seen_ids = set()
-        allowed_reports = set(report_ids) if report_ids else None
+        allowed_reports = (
+            {self.report_idx[r] for r in report_ids if r in self.report_idx}
+            if report_ids else None
+        )
+        n_chunks = self.size
 
-        for idx, score in zip(indices[0], distances[0]):
-            if idx < 0 or idx >= len(self.chunks):
-                continue
-            chunk = self.chunks[idx]
-            if allowed_reports and chunk["report_id"] not in allowed_reports:
+        for idx, score in zip(indices, distances):
+            if idx < 0 or idx >= n_chunks:
                 continue
-            if chunk["id"] in seen_ids:
+            if allowed_reports is not None and self.chunk_report_idx[idx] not in allowed_reports:
                 continue
-            seen_ids.add(chunk["id"])
-            results.append(
-                {
-                    "score": float(score),
-                    "text": chunk["text"],
-                    "report_id": chunk["report_id"],
-                    "report_name": chunk["report_name"],
-                    "page": chunk["page"],
-                }
-            )
+            chunk = self._chunk(int(idx))
+            chunk["score"] = float(score)
+            results.append(chunk)
             if len(results) >= top_k:
                 break
         return results
 
+    def _chunk(self, i: int) -> Dict[str, Any]:
+        report_id = self.report_table[self.chunk_report_idx[i]]
+        return {
+            "id": i,
+            "text": self.chunk_texts[i],
+            "report_id": report_id,
+            "report_name": self.reports[report_id]["name"],
+            "page": int(self.chunk_pages[i]),
+        }
+
     def list_reports(self) -> List[Dict[str, Any]]:
         return list(self.reports.values())
 
+    def report_context(self, report_id: str, max_chunks: Optional[int] = None) -> str:
+        """Prompt context for a report: its "(Page N) text" snippets joined."""
+        chunk_ids = self.chunks_by_report.get(report_id, [])[:max_chunks]
+        return "\n\n".join(self.chunk_formatted[i] for i in chunk_ids)
+
     def preview_text(self, report_id: str, max_chars: int = 1000) -> str:
-        chunks_for_report = [c for c in self.chunks if c["report_id"] == report_id]
-        if not chunks_for_report:
+        chunk_ids = self.chunks_by_report.get(report_id)
+        if not chunk_ids:
             return ""
-        text = " ".join(c["text"] for c in chunks_for_report)
+        text = " ".join(self.chunk_texts[i] for i in chunk_ids)
         return text[:max_chars]
 
 
 esg_index = ESGIndex()
 
 
-def extract_text_from_pdf(file_bytes: bytes) -> List[str]:
-    """Extract text but limit pages & chars per page for speed."""
-    reader = PdfReader(io.BytesIO(file_bytes))
-    pages_text = []
+UPLOAD_READ_CHUNK = 1024 * 1024
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+# PDFium is not thread-safe; every PDFium call made in this process (as
+# opposed to in pool workers) must hold this lock.
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _new_pdf_pool() -> ProcessPoolExecutor:
+    # Workers are spawned rather than forked because the server process is
+    # multithreaded; they start lazily and only import pdf_text.
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+# One long-lived pool for all uploads, replaced if a worker dies.
+_pdf_pool = _new_pdf_pool()
+_pdf_pool_lock = threading.Lock()
+
 
-    MAX_PAGES = 80
-    MAX_CHARS_PER_PAGE = 6000
+def _replace_broken_pdf_pool(broken: ProcessPoolExecutor):
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is broken:
+            broken.shutdown(wait=False)
+            _pdf_pool = _new_pdf_pool()
 
-    for i, page in enumerate(reader.pages):
-        if i >= MAX_PAGES:
-            break
-        txt = page.extract_text() or ""
-        if len(txt) > MAX_CHARS_PER_PAGE:
-            txt = txt[:MAX_CHARS_PER_PAGE]
-        pages_text.append(txt)
 
-    return pages_text
+def _extract_in_pool(ranges) -> List[str]:
+    pool = _pdf_pool
+    try:
+        return [txt for part in pool.map(extract_page_range, ranges) for txt in part]
+    except BrokenProcessPool:
+        _replace_broken_pdf_pool(pool)
+        raise
+
+
+def extract_text_from_pdf(path: str) -> List[str]:
+    """Extract text but limit pages & chars per page for speed."""
+    with _PDFIUM_LOCK:
+        n_pages = count_pages(path)
+    if n_pages == 0:
+        return []
+
+    # Split pages into contiguous ranges and extract them in separate
+    # processes; each one opens the file by path.
+    workers = min(PDF_WORKERS, n_pages)
+    step = -(-n_pages // workers)
+    ranges = [(path, i, min(i + step, n_pages)) for i in range(0, n_pages, step)]
+    if len(ranges) == 1:
+        with _PDFIUM_LOCK:
+            return extract_page_range(ranges[0])
+
+    try:
+        return _extract_in_pool(ranges)
+    except BrokenProcessPool:
+        # The pool may have been broken by an earlier crash; retry once on a
+        # fresh one. A second failure means this PDF kills its workers.
+        return _extract_in_pool(ranges)
 
 
 class QueryRequest(BaseModel):
     question: str
     report_ids: List[str] = []
-    top_k: int = 8
+    # Bounded because queries are searched in shared batches.
+    top_k: int = Field(8, ge=1, le=100)
 
 
 class QueryResponse(BaseModel):
@@ -290,7 +645,22 @@ class PreviewResponse(BaseModel):
     preview_text: str
 
 
-app = FastAPI(title="ESG Insight Assistant API")
+class AnalyzeRequest(BaseModel):
+    report_id: str
+
+
+class AnalyzeResponse(BaseModel):
+    report_id: str
+    summary: SummaryResponse
+    metrics: MetricsResponse
+    compliance: ComplianceResponse
+    risk: RiskResponse
+
+
+app = FastAPI(
+    title="ESG Insight Assistant API",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -310,8 +680,9 @@ def health():
     return {
         "status": "ok",
         "model": GEN_MODEL,
-        "chunks": len(esg_index.chunks),
+        "chunks": esg_index.size,
         "reports": len(esg_index.reports),
+        "faiss_gpu": FAISS_USE_GPU,
     }
 
 
@@ -322,24 +693,41 @@ async def upload_reports(files: List[UploadFile] = File(...)):
 
     for f in files:
         name = f.filename
-        content_bytes = await f.read()
 
         if name.lower().endswith(".pdf"):
-            pages = extract_text_from_pdf(content_bytes)
+            # Spool the upload to disk in chunks so PDFium can read it lazily
+            # instead of holding the whole file in memory.
+            tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            try:
+                with tmp:
+                    while chunk := await f.read(UPLOAD_READ_CHUNK):
+                        tmp.write(chunk)
+                pages = await asyncio.to_thread(extract_text_from_pdf, tmp.name)
+            except BrokenProcessPool:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Could not extract text from {name}; the PDF may be malformed.",
+                )
+            finally:
+                os.unlink(tmp.name)
             full_text = "\n\n".join(pages)
             if not full_text.strip():
                 raise HTTPException(status_code=400, detail=f"No text extracted from {name}")
             try:
-                esg_index.add_report(name=name, content=full_text, pages_text=pages)
+                await asyncio.to_thread(
+                    esg_index.add_report, name=name, content=full_text, pages_text=pages
+                )
             except MemoryError:
                 raise HTTPException(
                     status_code=413,
                     detail="This report is too large to process. Please upload a smaller file or a shorter extract.",
                 )
         else:
-            text = content_bytes.decode("utf-8", errors="ignore")
+            text = (await f.read()).decode("utf-8", errors="ignore")
             try:
-                esg_index.add_report(name=name, content=text, pages_text=[text])
+                await asyncio.to_thread(
+                    esg_index.add_report, name=name, content=text, pages_text=[text]
+                )
             except MemoryError:
                 raise HTTPException(
                     status_code=413,
@@ -383,23 +771,21 @@ def preview_report(report_id: str):
     return PreviewResponse(report_id=report_id, preview_text=preview)
 
 
-@app.post("/api/query", response_model=QueryResponse)
-def query_esg(req: QueryRequest):
-    question = req.question.strip()
-    if not question:
-        raise HTTPException(status_code=400, detail="Question is empty")
+async def _generate_cached(name: str, report_id: str, prompt: str) -> str:
+    """Call Gemini for `prompt`, reusing a previous answer for the same report."""
+    key = (name, report_id, hashlib.blake2b(prompt.encode()).hexdigest()[:16])
+    text = esg_index.llm_cache.get(key)
+    if text is None:
+        resp = await asyncio.to_thread(gen_model.generate_content, prompt)
+        text = resp.text.strip()
+        esg_index.llm_cache[key] = text
+    return text
 
-    search_results = esg_index.search(
-        query=question,
-        top_k=req.top_k,
-        report_ids=req.report_ids or None,
-    )
-    if not search_results:
-        return QueryResponse(
-            answer="I couldn’t find relevant ESG context for that question in the uploaded reports.",
-            citations=[],
-        )
 
+def _build_query_prompt(
+    question: str,
+    search_results: List[Dict[str, Any]]
+) -> Tuple[str, List[Dict[str, Any]]]:
     context_lines = []
     citations = []
     for i, item in enumerate(search_results, start=1):
@@ -419,191 +805,194 @@ def query_esg(req: QueryRequest):
     context_block = "\n\n".join(context_lines)
 
     prompt = (
-        "You are an ESG and sustainability analysis assistant. "
-        "You must answer ONLY using the context below. "
-        "If the answer is not clearly supported by the context, say you cannot find it.\n\n"
-        f"Context:\n{context_block}\n\n"
-        f"Question: {question}\n\n"
-        "Answer clearly and concisely. When relevant, refer to context items like [1], [2]."
+        QUERY_PROMPT_PREFIX + context_block
+        + "\n\nQuestion: " + question + QUERY_PROMPT_SUFFIX
+    )
+    return prompt, citations
+
+
+@app.post("/api/query", response_model=QueryResponse)
+async def query_esg(req: QueryRequest):
+    question = req.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is empty")
+
+    # Include the chunk count so answers are recomputed once new reports land;
+    # entries for older corpora age out of the LRU.
+    cache_key = (tuple(req.report_ids), req.top_k, question, esg_index.size)
+    cached = esg_index.get_cached_query(cache_key)
+    if cached is not None:
+        return cached
+
+    search_results = await esg_index.search(
+        query=question,
+        top_k=req.top_k,
+        report_ids=req.report_ids or None,
     )
+    if not search_results:
+        return QueryResponse(answer=NO_CONTEXT_ANSWER, citations=[])
+
+    prompt, citations = _build_query_prompt(question, search_results)
 
     try:
-        resp = gen_model.generate_content(prompt)
+        resp = await asyncio.to_thread(gen_model.generate_content, prompt)
         answer = resp.text.strip()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {e}")
 
-    return QueryResponse(answer=answer, citations=citations)
+    result = QueryResponse(answer=answer, citations=citations)
+    esg_index.cache_query(cache_key, result)
+    return result
 
 
-@app.post("/api/summary", response_model=SummaryResponse)
-def generate_summary(req: SummaryRequest):
-    report_id = req.report_id
+@app.post("/api/query/stream")
+async def query_esg_stream(req: QueryRequest):
+    """
+    Like /api/query, but streams newline-delimited JSON: first a
+    {"citations": [...]} line, then {"delta": "..."} lines as Gemini
+    generates the answer (or a single {"error": "..."} line on failure).
+    """
+    question = req.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is empty")
+
+    search_results = await esg_index.search(
+        query=question,
+        top_k=req.top_k,
+        report_ids=req.report_ids or None,
+    )
+
+    async def gen():
+        if not search_results:
+            yield orjson.dumps({"citations": []}) + b"\n"
+            yield orjson.dumps({"delta": NO_CONTEXT_ANSWER}) + b"\n"
+            return
+
+        prompt, citations = _build_query_prompt(question, search_results)
+        yield orjson.dumps({"citations": citations}) + b"\n"
+        try:
+            resp = await gen_model.generate_content_async(prompt, stream=True)
+            async for chunk in resp:
+                yield orjson.dumps({"delta": chunk.text}) + b"\n"
+        except Exception as e:
+            yield orjson.dumps({"error": f"Gemini API error: {e}"}) + b"\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+
+async def _summary(report_id: str) -> SummaryResponse:
     if report_id not in esg_index.reports:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    chunks_for_report = [c for c in esg_index.chunks if c["report_id"] == report_id]
-    max_chunks = 80
-    chunks_for_report = chunks_for_report[:max_chunks]
-
-    context = "\n\n".join(f"(Page {c['page']}) {c['text']}" for c in chunks_for_report)
+    context = esg_index.report_context(report_id, max_chunks=80)
 
-    prompt = (
-        "You are an ESG analyst. Based only on the context below, write a professional, "
-        "1-page ESG executive summary of this company's sustainability performance.\n\n"
-        "Structure the summary as markdown with the following sections:\n"
-        "1. Overview\n"
-        "2. Key environmental metrics (CO₂, energy, water, waste)\n"
-        "3. Social initiatives\n"
-        "4. Governance & risk management\n"
-        "5. Strengths\n"
-        "6. Gaps and risks\n\n"
-        "Be factual and avoid making up data. If a metric is not disclosed, say so.\n\n"
-        f"Context:\n{context}\n\n"
-        "Now write the markdown summary."
-    )
+    prompt = SUMMARY_PROMPT_PREFIX + context + SUMMARY_PROMPT_SUFFIX
 
     try:
-        resp = gen_model.generate_content(prompt)
-        summary_md = resp.text.strip()
+        summary_md = await _generate_cached("summary", report_id, prompt)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {e}")
 
     return SummaryResponse(report_id=report_id, summary_md=summary_md)
 
 
-@app.post("/api/metrics", response_model=MetricsResponse)
-def extract_metrics(req: MetricsRequest):
-    report_id = req.report_id
+@app.post("/api/summary", response_model=SummaryResponse)
+async def generate_summary(req: SummaryRequest):
+    return await _summary(req.report_id)
+
+
+async def _metrics(report_id: str) -> MetricsResponse:
     if report_id not in esg_index.reports:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    chunks_for_report = [c for c in esg_index.chunks if c["report_id"] == report_id]
-    max_chunks = 80
-    chunks_for_report = chunks_for_report[:max_chunks]
-    context = "\n\n".join(f"(Page {c['page']}) {c['text']}" for c in chunks_for_report)
+    context = esg_index.report_context(report_id, max_chunks=80)
 
-    prompt = (
-        "You are an ESG data extraction assistant. Based ONLY on the context below, "
-        "extract key ESG metrics and return them as strict JSON. Do not include commentary.\n\n"
-        "Use this exact JSON structure:\n"
-        "{\n"
-        '  "emissions": {\n'
-        '    "scope1_tco2e": number | null,\n'
-        '    "scope2_tco2e": number | null,\n'
-        '    "scope3_tco2e": number | null\n'
-        "  },\n"
-        '  "energy": {\n'
-        '    "total_mwh": number | null\n'
-        "  },\n"
-        '  "water": {\n'
-        '    "withdrawals_m3": number | null\n'
-        "  },\n"
-        '  "waste": {\n'
-        '    "total_tonnes": number | null\n'
-        "  },\n"
-        '  "social": {\n'
-        '    "employees_total": number | null\n'
-        "  },\n"
-        '  "governance": {\n'
-        '    "board_female_pct": number | null\n'
-        "  }\n"
-        "}\n\n"
-        "If a value is not clearly stated, use null. Do NOT add any extra top-level fields. "
-        "Respond with JSON only, no extra text.\n\n"
-        f"Context:\n{context}\n\n"
-        "Return JSON now."
-    )
+    prompt = METRICS_PROMPT_PREFIX + context + JSON_PROMPT_SUFFIX
 
     try:
-        resp = gen_model.generate_content(prompt)
-        raw = resp.text.strip()
+        raw = await _generate_cached("metrics", report_id, prompt)
         metrics = parse_strict_json(raw)
     except json.JSONDecodeError:
-        metrics = {"raw": resp.text}
+        metrics = {"raw": raw}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {e}")
 
     return MetricsResponse(report_id=report_id, metrics=metrics)
 
 
-@app.post("/api/compliance", response_model=ComplianceResponse)
-def compliance_check(req: ComplianceRequest):
-    report_id = req.report_id
+@app.post("/api/metrics", response_model=MetricsResponse)
+async def extract_metrics(req: MetricsRequest):
+    return await _metrics(req.report_id)
+
+
+async def _compliance(report_id: str) -> ComplianceResponse:
     if report_id not in esg_index.reports:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    chunks_for_report = [c for c in esg_index.chunks if c["report_id"] == report_id]
-    max_chunks = 80
-    chunks_for_report = chunks_for_report[:max_chunks]
-    context = "\n\n".join(f"(Page {c['page']}) {c['text']}" for c in chunks_for_report)
+    context = esg_index.report_context(report_id, max_chunks=80)
 
-    prompt = (
-        "You are an ESG reporting compliance assistant. Based ONLY on the context below, "
-        "assess whether the report discusses or references each of the following:\n"
-        "- SDGs (Sustainable Development Goals)\n"
-        "- GRI\n"
-        "- SASB\n"
-        "- IFRS S1\n"
-        "- IFRS S2\n\n"
-        "Return a strict JSON object with this structure:\n"
-        "{\n"
-        '  "sdgs": {"covered": boolean, "notes": string},\n'
-        '  "gri": {"covered": boolean, "notes": string},\n'
-        '  "sasb": {"covered": boolean, "notes": string},\n'
-        '  "ifrs_s1": {"covered": boolean, "notes": string},\n'
-        '  "ifrs_s2": {"covered": boolean, "notes": string}\n'
-        "}\n\n"
-        "If you are not sure, set covered to false and explain briefly in notes. "
-        "Respond with JSON only, no extra text.\n\n"
-        f"Context:\n{context}\n\n"
-        "Return JSON now."
-    )
+    prompt = COMPLIANCE_PROMPT_PREFIX + context + JSON_PROMPT_SUFFIX
 
     try:
-        resp = gen_model.generate_content(prompt)
-        raw = resp.text.strip()
+        raw = await _generate_cached("compliance", report_id, prompt)
         compliance = parse_strict_json(raw)
     except json.JSONDecodeError:
-        compliance = {"raw": resp.text}
+        compliance = {"raw": raw}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {e}")
 
     return ComplianceResponse(report_id=report_id, compliance=compliance)
 
 
-@app.post("/api/risk", response_model=RiskResponse)
-def greenwashing_risk(req: RiskRequest):
-    report_id = req.report_id
+@app.post("/api/compliance", response_model=ComplianceResponse)
+async def compliance_check(req: ComplianceRequest):
+    return await _compliance(req.report_id)
+
+
+async def _risk(report_id: str) -> RiskResponse:
     if report_id not in esg_index.reports:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    chunks_for_report = [c for c in esg_index.chunks if c["report_id"] == report_id]
-    max_chunks = 80
-    chunks_for_report = chunks_for_report[:max_chunks]
-    context = "\n\n".join(f"(Page {c['page']}) {c['text']}" for c in chunks_for_report)
+    context = esg_index.report_context(report_id, max_chunks=80)
 
-    prompt = (
-        "You are an ESG analyst assessing potential greenwashing. Based ONLY on the context below, "
-        "assign a simple greenwashing risk label and explanation.\n\n"
-        "Choose one of these labels: Low, Medium, High.\n\n"
-        "Return a strict JSON object:\n"
-        '{\n  "score": "Low" | "Medium" | "High",\n  "explanation": string\n}\n\n'
-        "Do not add other fields. Respond with JSON only.\n\n"
-        f"Context:\n{context}\n\n"
-        "Return JSON now."
-    )
+    prompt = RISK_PROMPT_PREFIX + context + JSON_PROMPT_SUFFIX
 
     try:
-        resp = gen_model.generate_content(prompt)
-        raw = resp.text.strip()
+        raw = await _generate_cached("risk", report_id, prompt)
         data = parse_strict_json(raw)
         score = str(data.get("score", "Medium"))
         explanation = str(data.get("explanation", ""))
     except json.JSONDecodeError:
         score = "Medium"
-        explanation = resp.text
+        explanation = raw
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {e}")
 
     return RiskResponse(report_id=report_id, score=score, explanation=explanation)
+
+
+@app.post("/api/risk", response_model=RiskResponse)
+async def greenwashing_risk(req: RiskRequest):
+    return await _risk(req.report_id)
+
+
+@app.post("/api/analyze", response_model=AnalyzeResponse)
+async def analyze_report(req: AnalyzeRequest):
+    """Run summary, metrics, compliance and risk concurrently for one report."""
+    report_id = req.report_id
+    if report_id not in esg_index.reports:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    summary, metrics, compliance, risk = await asyncio.gather(
+        _summary(report_id),
+        _metrics(report_id),
+        _compliance(report_id),
+        _risk(report_id),
+    )
+    return AnalyzeResponse(
+        report_id=report_id,
+        summary=summary,
+        metrics=metrics,
+        compliance=compliance,
+        risk=risk,
+    )
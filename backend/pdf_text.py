@@ -0,0 +1,37 @@
+"""
+PDF text extraction helpers.
+
+Kept separate from app.py so spawned extraction workers only import
+PDFium, not the API server, Gemini client or search index.
+"""
+from typing import List
+
+import pypdfium2 as pdfium
+
+
+MAX_PAGES = 80
+MAX_CHARS_PER_PAGE = 6000
+
+
+def count_pages(path: str) -> int:
+    """Number of pages to extract, capped at MAX_PAGES."""
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return min(len(pdf), MAX_PAGES)
+    finally:
+        pdf.close()
+
+
+def extract_page_range(args) -> List[str]:
+    """Worker: extract text for pages [start, stop) of a PDF."""
+    path, start, stop = args
+    pdf = pdfium.PdfDocument(path)
+    try:
+        pages_text = []
+        for i in range(start, stop):
+            page = pdf[i]
+            txt = page.get_textpage().get_text_range() or ""
+            pages_text.append(txt[:MAX_CHARS_PER_PAGE])
+        return pages_text
+    finally:
+        pdf.close()